@@ -2,24 +2,44 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import math
 import re
+import time
 from datetime import datetime, timezone
-from decimal import Decimal, InvalidOperation
 from zoneinfo import ZoneInfo
 
 from aiogram import Bot, Dispatcher, F
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.filters import Command, CommandObject
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message, WebAppInfo
 from dotenv import load_dotenv
 
 from .categories import CATEGORIES, parse_category
 from .classifier import normalize_text, predict_category
-from .config import load_settings
+from .config import Settings, load_settings
 from .db import Database, format_category_lines, format_last_line
 from .taxonomy import SUBCATEGORY_TO_CATEGORY, category_label, subcategory_label
 
-AMOUNT_RE = re.compile(r"^\d+(?:[\.,]\d{1,2})?$")
 TIME_RE = re.compile(r"^(?:[01]\d|2[0-3]):[0-5]\d$")
+# A whitespace-delimited amount token, optionally wrapped in currency markers and punctuation.
+_AMOUNT_AFFIX = r"(?:[.,:;!?()\[\]{}₽$€]|rub|rur|usd|eur)*"
+_EXPENSE_RE = re.compile(
+    rf"(?<!\S){_AMOUNT_AFFIX}(\d+(?:[.,]\d{{1,2}})?){_AMOUNT_AFFIX}(?!\S)",
+    re.IGNORECASE,
+)
+_CATEGORY_ITEMS: tuple[tuple[str, str], ...] = tuple(CATEGORIES)
+# Each reminder send holds its slot for at least REMINDER_SLOT_HOLD_SEC, capping reminders at
+# 25 messages/sec: under Telegram's ~30/sec per-bot limit, with headroom left for replies.
+REMINDER_SEND_CONCURRENCY = 25
+REMINDER_SLOT_HOLD_SEC = 1.0
+REMINDER_TEXT = (
+    "📝 Кажется, вы еще не записывали расходы сегодня. Не забудьте сделать это.\n\n"
+    "Отключить напоминания или изменить время можно в /settings"
+)
+DB_MAINTENANCE_INTERVAL_SEC = 7 * 24 * 3600
+# The bot restarts on every deploy, so the first run can't wait out a whole interval.
+DB_MAINTENANCE_STARTUP_DELAY_SEC = 10 * 60
+GROUP_CHAT_TYPES = frozenset({"group", "supergroup"})
 BASE_CATEGORIES = {"food", "transport", "home", "health", "fun", "shopping", "subscriptions", "other"}
 logger = logging.getLogger(__name__)
 
@@ -27,68 +47,52 @@ logger = logging.getLogger(__name__)
 def parse_amount(raw: str | None) -> float | None:
     if raw is None:
         return None
-    cleaned = raw.replace(",", ".").strip()
+    cleaned = raw.replace(",", ".")
     try:
-        value = Decimal(cleaned)
-    except InvalidOperation:
+        value = float(cleaned)
+    except ValueError:
         return None
 
-    if value <= 0:
+    if not math.isfinite(value) or value <= 0:
         return None
-    return float(value)
-
-
-def parse_amount_token(token: str) -> float | None:
-    cleaned = token.strip().lower()
-    cleaned = cleaned.replace("₽", "").replace("rub", "").replace("rur", "")
-    cleaned = cleaned.replace("$", "").replace("usd", "")
-    cleaned = cleaned.replace("€", "").replace("eur", "")
-    cleaned = cleaned.strip(".,:;!?()[]{}")
-    if not cleaned or not AMOUNT_RE.match(cleaned):
-        return None
-    return parse_amount(cleaned)
+    return value
 
 
 def extract_expense_parts(text: str) -> tuple[float, str | None, str] | None:
-    tokens = text.split()
-    if not tokens:
-        return None
-
-    amount_idx = None
-    amount = None
-    for idx, token in enumerate(tokens):
-        candidate = parse_amount_token(token)
-        if candidate is not None:
-            amount_idx = idx
-            amount = candidate
+    for match in _EXPENSE_RE.finditer(text):
+        amount = parse_amount(match.group(1))
+        if amount is not None:
             break
-
-    if amount is None or amount_idx is None:
+    else:
         return None
 
-    rest_tokens = tokens[:amount_idx] + tokens[amount_idx + 1 :]
-    if not rest_tokens:
+    before = text[: match.start()].strip()
+    after = text[match.end() :].strip()
+    head = before or after
+    if not head:
         return amount, None, ""
 
-    quick_category = parse_category(rest_tokens[0])
+    first_word, *remainder = head.split(maxsplit=1)
+    quick_category = parse_category(first_word)
     if quick_category:
-        note = " ".join(rest_tokens[1:]).strip()
+        rest = remainder[0] if remainder else ""
+        note = f"{rest} {after}".strip() if before else rest
         return amount, quick_category, note
 
-    note = " ".join(rest_tokens).strip()
-    return amount, None, note
+    return amount, None, f"{before} {after}".strip()
 
 
 def category_keyboard(pending_id: int) -> InlineKeyboardMarkup:
+    prefix = f"cat:{pending_id}:"
     buttons = [
-        [InlineKeyboardButton(text=label, callback_data=f"cat:{pending_id}:{key}")]
-        for key, label in CATEGORIES
+        [InlineKeyboardButton(text=label, callback_data=prefix + key)]
+        for key, label in _CATEGORY_ITEMS
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
 def ensure_group_chat(message: Message) -> bool:
-    return message.chat.type in {"group", "supergroup"}
+    return message.chat.type in GROUP_CHAT_TYPES
 
 
 def parse_timezone(raw: str) -> str | None:
@@ -131,16 +135,19 @@ def webapp_keyboard(url: str, use_webapp_button: bool) -> InlineKeyboardMarkup:
     )
 
 
-async def main() -> None:
-    load_dotenv()
-    logging.basicConfig(level=logging.INFO)
-    settings = load_settings()
-    db = Database(settings.db_path)
-    await db.init()
-
+async def run_bot(settings: Settings, db: Database) -> None:
     bot = Bot(settings.bot_token)
     dp = Dispatcher()
 
+    async def touch_group(message: Message) -> None:
+        # Cheap after the first call per chat: Database skips unchanged groups.
+        await db.ensure_group(
+            message.chat.id,
+            message.chat.title or "",
+            settings.default_currency,
+            settings.default_timezone,
+        )
+
     async def process_expense_text(message: Message, raw_text: str, reply_on_error: bool) -> bool:
         parsed = extract_expense_parts(raw_text)
         if parsed is None:
@@ -155,12 +162,7 @@ async def main() -> None:
             username=message.from_user.username or "",
             first_name=message.from_user.first_name or "",
         )
-        await db.ensure_group(
-            message.chat.id,
-            message.chat.title or "",
-            settings.default_currency,
-            settings.default_timezone,
-        )
+        await touch_group(message)
 
         currency = await db.get_group_currency(message.chat.id, settings.default_currency)
         normalized_note = normalize_text(note)
@@ -188,7 +190,7 @@ async def main() -> None:
         prediction = None
         if note:
             alias_subcategory = await db.get_alias_subcategory(message.chat.id, normalized_note)
-            prediction = predict_category(note, alias_subcategory=alias_subcategory)
+            prediction = predict_category(note, alias_subcategory=alias_subcategory, normalized=normalized_note)
 
         if prediction and prediction.confidence >= settings.auto_category_threshold:
             expense_id = await db.add_expense(
@@ -269,10 +271,10 @@ async def main() -> None:
         return True
 
     async def render_settings(chat_id: int) -> tuple[str, InlineKeyboardMarkup]:
-        group = await db.get_group_settings(chat_id)
+        group = await db.get_chat_context(chat_id)
         if group is None:
             await db.ensure_group(chat_id, "", settings.default_currency, settings.default_timezone)
-            group = await db.get_group_settings(chat_id)
+            group = await db.get_chat_context(chat_id)
             assert group is not None
 
         enabled = bool(group["reminder_enabled"])
@@ -289,26 +291,82 @@ async def main() -> None:
         )
         return text, settings_keyboard(chat_id, enabled)
 
+    async def reply_today(message: Message) -> None:
+        currency = await db.get_group_currency(message.chat.id, settings.default_currency)
+        total, rows = await db.today_summary(message.chat.id)
+        await message.answer(f"Сегодня: {total:.2f} {currency}\n\n{format_category_lines(rows)}")
+
+    async def reply_month(message: Message) -> None:
+        currency = await db.get_group_currency(message.chat.id, settings.default_currency)
+        total, rows = await db.month_summary(message.chat.id)
+        await message.answer(f"За месяц: {total:.2f} {currency}\n\n{format_category_lines(rows)}")
+
+    async def reply_last(message: Message) -> None:
+        currency = await db.get_group_currency(message.chat.id, settings.default_currency)
+        rows = await db.last_expenses(message.chat.id, limit=10)
+        if not rows:
+            await message.answer("Расходов пока нет")
+            return
+
+        lines = [
+            format_last_line(expense_id, amount, category, subcategory, note, user_id, currency)
+            for expense_id, amount, category, subcategory, note, user_id in rows
+        ]
+        await message.answer("Последние 10 расходов:\n" + "\n".join(lines))
+
+    async def reply_undo(message: Message) -> None:
+        removed_id = await db.undo_last_by_user(message.chat.id, message.from_user.id)
+        if removed_id is None:
+            await message.answer("У тебя нет расходов для отмены")
+            return
+
+        await message.answer(f"Удален последний расход: #{removed_id}")
+
+    # Slash-commands that also arrive through the plain-text handler.
+    plain_commands = {
+        "today": reply_today,
+        "month": reply_month,
+        "last": reply_last,
+        "undo": reply_undo,
+    }
+
+    reminder_slots = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+
+    async def send_reminder(group_id: int, local_date: str) -> None:
+        async with reminder_slots:
+            started = time.monotonic()
+            try:
+                try:
+                    await bot.send_message(chat_id=group_id, text=REMINDER_TEXT)
+                except TelegramRetryAfter as exc:
+                    logger.warning("reminder rate-limited: group=%s retry_after=%s", group_id, exc.retry_after)
+                    await asyncio.sleep(exc.retry_after)
+                    await bot.send_message(chat_id=group_id, text=REMINDER_TEXT)
+                await db.mark_group_reminded(group_id, local_date)
+            except Exception as exc:
+                # One group's failure must not block the others; it stays due and is retried next tick.
+                logger.warning("reminder failed: group=%s error=%r", group_id, exc)
+            await asyncio.sleep(REMINDER_SLOT_HOLD_SEC - (time.monotonic() - started))
+
     async def reminder_worker() -> None:
         while True:
             now_utc = datetime.now(timezone.utc)
             due_groups = await db.list_groups_due_for_reminder(now_utc)
-            for group_id, _title, local_date in due_groups:
-                try:
-                    await bot.send_message(
-                        chat_id=group_id,
-                        text=(
-                            "📝 Кажется, вы еще не записывали расходы сегодня. Не забудьте сделать это.\n\n"
-                            "Отключить напоминания или изменить время можно в /settings"
-                        ),
-                    )
-                    await db.mark_group_reminded(group_id, local_date)
-                except Exception:
-                    # Skip failures to avoid blocking all groups.
-                    continue
+            await asyncio.gather(
+                *(send_reminder(group_id, local_date) for group_id, _title, local_date in due_groups)
+            )
 
             await asyncio.sleep(settings.reminder_check_interval_sec)
 
+    async def maintenance_worker() -> None:
+        await asyncio.sleep(DB_MAINTENANCE_STARTUP_DELAY_SEC)
+        while True:
+            try:
+                await db.run_maintenance()
+            except Exception:
+                logger.exception("database maintenance failed")
+            await asyncio.sleep(DB_MAINTENANCE_INTERVAL_SEC)
+
     @dp.message(Command("start"))
     async def cmd_start(message: Message) -> None:
         await db.upsert_user(
@@ -318,12 +376,7 @@ async def main() -> None:
         )
 
         if ensure_group_chat(message):
-            await db.ensure_group(
-                message.chat.id,
-                message.chat.title or "",
-                settings.default_currency,
-                settings.default_timezone,
-            )
+            await touch_group(message)
             app_url = build_group_app_url(settings, message.chat.id)
             await message.answer(
                 "Бот активен в группе. Просто пиши расход текстом: `450 кофе`.\n"
@@ -344,12 +397,7 @@ async def main() -> None:
     @dp.message(Command("app"))
     async def cmd_app(message: Message) -> None:
         if ensure_group_chat(message):
-            await db.ensure_group(
-                message.chat.id,
-                message.chat.title or "",
-                settings.default_currency,
-                settings.default_timezone,
-            )
+            await touch_group(message)
             app_url = build_group_app_url(settings, message.chat.id)
             await message.answer("Открыть TG App:", reply_markup=webapp_keyboard(app_url, use_webapp_button=False))
             return
@@ -369,11 +417,11 @@ async def main() -> None:
         if command.args:
             args = command.args.split()
             if args:
-                c = args[0].strip().upper()
+                c = args[0].upper()
                 if 2 <= len(c) <= 6 and c.isalpha():
                     currency = c
             if len(args) > 1:
-                tz_name = parse_timezone(args[1].strip())
+                tz_name = parse_timezone(args[1])
 
         await db.upsert_user(
             user_id=message.from_user.id,
@@ -391,12 +439,7 @@ async def main() -> None:
         if not ensure_group_chat(message):
             await message.answer("/settings работает только в группе")
             return
-        await db.ensure_group(
-            message.chat.id,
-            message.chat.title or "",
-            settings.default_currency,
-            settings.default_timezone,
-        )
+        await touch_group(message)
         text, keyboard = await render_settings(message.chat.id)
         await message.answer(text, parse_mode="Markdown", reply_markup=keyboard)
 
@@ -405,11 +448,11 @@ async def main() -> None:
         if not ensure_group_chat(message):
             await message.answer("/remind работает только в группе")
             return
-        if not command.args or not TIME_RE.match(command.args.strip()):
+        reminder_time = (command.args or "").strip()
+        if not TIME_RE.match(reminder_time):
             await message.answer("Формат: /remind HH:MM")
             return
 
-        reminder_time = command.args.strip()
         await db.set_reminder_time(message.chat.id, reminder_time)
         await message.answer(f"Время напоминаний обновлено: {reminder_time}")
 
@@ -444,7 +487,7 @@ async def main() -> None:
             return
 
         if action == "t":
-            group = await db.get_group_settings(target_group_id)
+            group = await db.get_chat_context(target_group_id)
             enabled = bool(group["reminder_enabled"]) if group else True
             await db.set_reminder_enabled(target_group_id, not enabled)
             await query.answer("Настройки обновлены")
@@ -490,40 +533,10 @@ async def main() -> None:
             head = text[1:].split(maxsplit=1)[0].lower()
             cmd = head.split("@", 1)[0]
 
-            if cmd == "today":
-                currency = await db.get_group_currency(message.chat.id, settings.default_currency)
-                total, rows = await db.today_summary(message.chat.id)
-                await message.answer(f"Сегодня: {total:.2f} {currency}\n\n{format_category_lines(rows)}")
-                return
-
-            if cmd == "month":
-                currency = await db.get_group_currency(message.chat.id, settings.default_currency)
-                total, rows = await db.month_summary(message.chat.id)
-                await message.answer(f"За месяц: {total:.2f} {currency}\n\n{format_category_lines(rows)}")
-                return
-
-            if cmd == "last":
-                currency = await db.get_group_currency(message.chat.id, settings.default_currency)
-                rows = await db.last_expenses(message.chat.id, limit=10)
-                if not rows:
-                    await message.answer("Расходов пока нет")
-                else:
-                    lines = [
-                        format_last_line(expense_id, amount, category, subcategory, note, user_id, currency)
-                        for expense_id, amount, category, subcategory, note, user_id in rows
-                    ]
-                    await message.answer("Последние 10 расходов:\n" + "\n".join(lines))
-                return
-
-            if cmd == "undo":
-                removed_id = await db.undo_last_by_user(message.chat.id, message.from_user.id)
-                if removed_id is None:
-                    await message.answer("У тебя нет расходов для отмены")
-                else:
-                    await message.answer(f"Удален последний расход: #{removed_id}")
-                return
-
+            handler = plain_commands.get(cmd)
             # Unknown slash-command: ignore in plain-text fallback.
+            if handler is not None:
+                await handler(message)
             return
 
         await process_expense_text(message, text, reply_on_error=False)
@@ -616,11 +629,7 @@ async def main() -> None:
             await message.answer("/today работает только в группе")
             return
 
-        currency = await db.get_group_currency(message.chat.id, settings.default_currency)
-        total, rows = await db.today_summary(message.chat.id)
-        await message.answer(
-            f"Сегодня: {total:.2f} {currency}\n\n{format_category_lines(rows)}"
-        )
+        await reply_today(message)
 
     @dp.message(Command("month"))
     async def cmd_month(message: Message) -> None:
@@ -628,11 +637,7 @@ async def main() -> None:
             await message.answer("/month работает только в группе")
             return
 
-        currency = await db.get_group_currency(message.chat.id, settings.default_currency)
-        total, rows = await db.month_summary(message.chat.id)
-        await message.answer(
-            f"За месяц: {total:.2f} {currency}\n\n{format_category_lines(rows)}"
-        )
+        await reply_month(message)
 
     @dp.message(Command("last"))
     async def cmd_last(message: Message) -> None:
@@ -640,17 +645,7 @@ async def main() -> None:
             await message.answer("/last работает только в группе")
             return
 
-        currency = await db.get_group_currency(message.chat.id, settings.default_currency)
-        rows = await db.last_expenses(message.chat.id, limit=10)
-        if not rows:
-            await message.answer("Расходов пока нет")
-            return
-
-        lines = [
-            format_last_line(expense_id, amount, category, subcategory, note, user_id, currency)
-            for expense_id, amount, category, subcategory, note, user_id in rows
-        ]
-        await message.answer("Последние 10 расходов:\n" + "\n".join(lines))
+        await reply_last(message)
 
     @dp.message(Command("undo"))
     async def cmd_undo(message: Message) -> None:
@@ -658,22 +653,34 @@ async def main() -> None:
             await message.answer("/undo работает только в группе")
             return
 
-        removed_id = await db.undo_last_by_user(message.chat.id, message.from_user.id)
-        if removed_id is None:
-            await message.answer("У тебя нет расходов для отмены")
-            return
-
-        await message.answer(f"Удален последний расход: #{removed_id}")
+        await reply_undo(message)
 
-    reminder_task = asyncio.create_task(reminder_worker())
+    background_tasks = [
+        asyncio.create_task(reminder_worker()),
+        asyncio.create_task(maintenance_worker()),
+    ]
     try:
         await dp.start_polling(bot)
     finally:
-        reminder_task.cancel()
-        try:
-            await reminder_task
-        except asyncio.CancelledError:
-            pass
+        for task in background_tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+async def main() -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    settings = load_settings()
+    db = Database(settings.db_path)
+    # Everything past this point runs under close(): an open connection would keep a failed process alive.
+    try:
+        await db.init()
+        await run_bot(settings, db)
+    finally:
+        await db.close()
 
 
 if __name__ == "__main__":
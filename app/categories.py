@@ -34,6 +34,7 @@ CATEGORY_ALIASES: dict[str, str] = {
 
 
 def parse_category(raw: str | None) -> str | None:
+    # Callers pass whitespace-split words, so only case needs folding.
     if not raw:
         return None
-    return CATEGORY_ALIASES.get(raw.strip().lower())
+    return CATEGORY_ALIASES.get(raw.lower())
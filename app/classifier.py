@@ -1,13 +1,35 @@
 from __future__ import annotations
 
 import re
-from collections import defaultdict
+from collections.abc import Callable
 from dataclasses import dataclass
+from functools import lru_cache
 
-from .taxonomy import SUBCATEGORIES, SUBCATEGORY_TO_CATEGORY
+from .taxonomy import KEYWORD_TO_SUBCAT, SUBCATEGORIES, SUBCATEGORY_TO_CATEGORY
 
+_NON_ALNUM_RE = re.compile(r"[^a-zа-я0-9\s]", re.IGNORECASE)
 
-@dataclass(frozen=True)
+
+def _normalize_codepoint(codepoint: int) -> str:
+    return _NON_ALNUM_RE.sub(" ", chr(codepoint).lower())
+
+
+# str.translate table: lowercase letters/digits/spaces, blank everything else. Latin, Cyrillic and the
+# punctuation/currency blocks are precomputed; other codepoints (emoji, CJK, ...) are mapped on the fly
+# and never stored, so chat input can't grow the table.
+class _NormalizeTable(dict):
+    def __missing__(self, codepoint: int) -> str:
+        return _normalize_codepoint(codepoint)
+
+
+_NORMALIZE_TABLE = _NormalizeTable(
+    (cp, _normalize_codepoint(cp)) for block in (range(0x0530), range(0x2000, 0x20D0)) for cp in block
+)
+_NORMALIZE_TABLE.update((cp, cp + 32) for cp in range(ord("A"), ord("Z") + 1))
+_NORMALIZE_TABLE.update((cp, cp + 32) for cp in range(ord("А"), ord("Я") + 1))
+
+
+@dataclass(frozen=True, slots=True)
 class Prediction:
     category: str
     subcategory: str
@@ -15,40 +37,84 @@ class Prediction:
     reason: str
 
 
+# Keywords equal to the whole note or to its leading whole words ("еда домой" spans two).
+_MAX_KEYWORD_WORDS = max(word.count(" ") + 1 for word in KEYWORD_TO_SUBCAT)
+
+
+def _leading_keywords(text: str) -> set[str]:
+    words = text.split(" ", _MAX_KEYWORD_WORDS)
+    found: set[str] = set()
+    for count in range(1, min(len(words), _MAX_KEYWORD_WORDS) + 1):
+        prefix = " ".join(words[:count])
+        if prefix in KEYWORD_TO_SUBCAT:
+            found.add(prefix)
+    return found
+
+
+# Straight-line `in` check per keyword: str.__contains__ beats a Python-level automaton here.
+def _compile_keyword_scanner() -> Callable[[str, list[float], set[str]], bool]:
+    lines = ["def _scan_keywords(s, scores, leading):", "    hit = False"]
+    for sub_index, sub in enumerate(SUBCATEGORIES):
+        for word in sub.keywords:
+            lines += [
+                f"    if {word!r} in s:",
+                "        hit = True",
+                f"        scores[{sub_index}] += 1.0",
+                f"        if {word!r} in leading:",
+                f"            scores[{sub_index}] += 0.35",
+            ]
+    lines.append("    return hit")
+    namespace: dict = {}
+    exec("\n".join(lines), namespace)
+    return namespace["_scan_keywords"]
+
+
+# Scores are indexed by position in SUBCATEGORIES.
+_SUB_KEYS: tuple[str, ...] = tuple(sub.key for sub in SUBCATEGORIES)
+_scan_keywords = _compile_keyword_scanner()
+_ALIAS_PREDICTIONS: dict[str, Prediction] = {
+    key: Prediction(category=category, subcategory=key, confidence=0.97, reason="alias")
+    for key, category in SUBCATEGORY_TO_CATEGORY.items()
+}
+
+
 def normalize_text(text: str) -> str:
-    lowered = text.lower().strip()
-    cleaned = re.sub(r"[^a-zа-я0-9\s]", " ", lowered, flags=re.IGNORECASE)
-    cleaned = re.sub(r"\s+", " ", cleaned).strip()
-    return cleaned
+    return " ".join(text.translate(_NORMALIZE_TABLE).split())
 
 
-def predict_category(note: str, alias_subcategory: str | None = None) -> Prediction | None:
-    normalized = normalize_text(note)
+def predict_category(
+    note: str,
+    normalized: str | None = None,
+    alias_subcategory: str | None = None,
+) -> Prediction | None:
+    if normalized is None:
+        normalized = normalize_text(note)
     if not normalized:
         return None
 
-    if alias_subcategory and alias_subcategory in SUBCATEGORY_TO_CATEGORY:
-        return Prediction(
-            category=SUBCATEGORY_TO_CATEGORY[alias_subcategory],
-            subcategory=alias_subcategory,
-            confidence=0.97,
-            reason="alias",
-        )
+    if alias_subcategory:
+        alias_prediction = _ALIAS_PREDICTIONS.get(alias_subcategory)
+        if alias_prediction is not None:
+            return alias_prediction
+
+    return _predict_normalized(normalized)
 
-    score: dict[str, float] = defaultdict(float)
-    for sub in SUBCATEGORIES:
-        for word in sub.keywords:
-            if word in normalized:
-                score[sub.key] += 1.0
-                if normalized == word or normalized.startswith(word + " "):
-                    score[sub.key] += 0.35
 
-    if not score:
+# Notes repeat a lot ("кофе", "такси"); Prediction is frozen, so cached results are safe to share.
+@lru_cache(maxsize=4096)
+def _predict_normalized(normalized: str) -> Prediction | None:
+    scores = [0.0] * len(_SUB_KEYS)
+    if not _scan_keywords(normalized, scores, _leading_keywords(normalized)):
         return None
 
-    ranked = sorted(score.items(), key=lambda x: x[1], reverse=True)
-    best_subcategory, best_score = ranked[0]
-    second_score = ranked[1][1] if len(ranked) > 1 else 0.0
+    # Ties go to the earlier subcategory, as with the previous stable sort.
+    best_index, best_score, second_score = 0, 0.0, 0.0
+    for index, value in enumerate(scores):
+        if value > best_score:
+            best_index, best_score, second_score = index, value, best_score
+        elif value > second_score:
+            second_score = value
+    best_subcategory = _SUB_KEYS[best_index]
 
     confidence = min(0.98, 0.55 + (best_score * 0.12) - (second_score * 0.07))
     confidence = max(0.2, confidence)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass
+from functools import lru_cache
 
 
 @dataclass(frozen=True)
@@ -16,7 +17,7 @@ class Settings:
     tg_app_url_template: str
 
 
-
+@lru_cache(maxsize=1)
 def load_settings() -> Settings:
     token = os.getenv("BOT_TOKEN", "").strip()
     if not token:
@@ -1,158 +1,318 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
-from datetime import date, datetime, time, timedelta, timezone
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime, time, timedelta, timezone
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
 import aiosqlite
 
-from .taxonomy import category_label, subcategory_label
+from .taxonomy import CATEGORY_LABEL, SUBCATEGORY_LABEL
+
+# Expense inserts queued at the same time are written in one transaction (one commit).
+EXPENSE_BATCH_SIZE = 50
+# Feedback events arriving within this window are flushed together.
+FEEDBACK_FLUSH_DELAY_SEC = 0.02
+
+INSERT_EXPENSE_SQL = """
+    INSERT INTO expenses (
+        group_id, user_id, category, subcategory, amount, note, spent_at, spent_at_ts, source_message_id,
+        auto_category, auto_subcategory, auto_confidence, is_auto_applied, raw_comment_normalized
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    RETURNING id
+"""
+
+# Hot-path statements; sqlite3 reuses a compiled statement when the SQL text repeats.
+SELECT_ALIAS_SQL = """
+    SELECT subcategory
+    FROM merchant_aliases
+    WHERE group_id = ? AND normalized_pattern = ?
+    LIMIT 1
+"""
+
+SELECT_CHAT_CONTEXT_SQL = """
+    SELECT group_id, title, currency, timezone, reminder_enabled, reminder_time
+    FROM group_settings
+    WHERE group_id = ?
+"""
+
+UPDATE_LAST_EXPENSE_DATE_SQL = """
+    UPDATE group_settings
+    SET last_expense_local_date = ?
+    WHERE group_id = ?
+"""
+
+BUMP_EXPENSES_VERSION_SQL = """
+    UPDATE group_settings
+    SET expenses_version = expenses_version + 1
+    WHERE group_id = ?
+"""
+
+# Amounts are entered with at most two decimals, so summing whole cents keeps totals exact.
+AMOUNT_CENTS_SQL = "CAST(ROUND(amount * 100) AS INTEGER)"
+
+STATEMENT_CACHE_SIZE = 256
+
+# Lookups are always by (group_id, normalized_pattern), so that pair is the clustered key.
+MERCHANT_ALIASES_SCHEMA = """(
+    group_id INTEGER NOT NULL,
+    normalized_pattern TEXT NOT NULL,
+    subcategory TEXT NOT NULL,
+    confidence REAL NOT NULL DEFAULT 0.9,
+    source TEXT NOT NULL DEFAULT 'feedback',
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    PRIMARY KEY (group_id, normalized_pattern)
+) WITHOUT ROWID, STRICT"""
+
+# Tables as created on a fresh database; later columns are added through COLUMN_MIGRATIONS.
+SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL DEFAULT '',
+        first_name TEXT NOT NULL DEFAULT '',
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS group_settings (
+        group_id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL DEFAULT '',
+        currency TEXT NOT NULL DEFAULT 'RUB',
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS expenses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        amount REAL NOT NULL,
+        note TEXT NOT NULL DEFAULT '',
+        spent_at TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        source_message_id INTEGER NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS pending_expenses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        note TEXT NOT NULL DEFAULT '',
+        source_message_id INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS category_feedback (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_id INTEGER NOT NULL,
+        raw_comment_normalized TEXT NOT NULL,
+        predicted_subcategory TEXT NOT NULL,
+        chosen_subcategory TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS merchant_aliases {MERCHANT_ALIASES_SCHEMA};
+"""
+
+# Columns added after the first release, checked against PRAGMA table_info once per table.
+COLUMN_MIGRATIONS: dict[str, tuple[str, ...]] = {
+    "group_settings": (
+        "reminder_enabled INTEGER NOT NULL DEFAULT 1",
+        "reminder_time TEXT NOT NULL DEFAULT '21:00'",
+        "timezone TEXT NOT NULL DEFAULT 'Europe/Moscow'",
+        "last_reminder_date TEXT NOT NULL DEFAULT ''",
+        # Local date of the group's latest expense; lets the reminder tick skip querying expenses.
+        "last_expense_local_date TEXT NOT NULL DEFAULT ''",
+        # reminder_time as minutes since local midnight, parsed once on write.
+        "reminder_minutes INTEGER NOT NULL DEFAULT 1260",
+        # Bumped in every transaction that inserts or deletes the group's expenses.
+        "expenses_version INTEGER NOT NULL DEFAULT 0",
+    ),
+    "expenses": (
+        "subcategory TEXT NOT NULL DEFAULT ''",
+        "auto_category TEXT NOT NULL DEFAULT ''",
+        "auto_subcategory TEXT NOT NULL DEFAULT ''",
+        "auto_confidence REAL NOT NULL DEFAULT 0",
+        "is_auto_applied INTEGER NOT NULL DEFAULT 0",
+        "raw_comment_normalized TEXT NOT NULL DEFAULT ''",
+        # Epoch seconds mirror of spent_at; range filters compare integers instead of ISO strings.
+        "spent_at_ts INTEGER",
+    ),
+    "pending_expenses": (
+        "predicted_category TEXT NOT NULL DEFAULT ''",
+        "predicted_subcategory TEXT NOT NULL DEFAULT ''",
+        "predicted_confidence REAL NOT NULL DEFAULT 0",
+        "raw_comment_normalized TEXT NOT NULL DEFAULT ''",
+    ),
+    "category_feedback": (
+        "predicted_subcategory TEXT NOT NULL DEFAULT ''",
+        "chosen_subcategory TEXT NOT NULL DEFAULT ''",
+    ),
+    "merchant_aliases": ("subcategory TEXT NOT NULL DEFAULT ''",),
+}
+
+# Connection settings applied in init(); journal_mode=WAL is persistent in the file.
+# auto_vacuum only takes effect when the database file is created and is a no-op afterwards.
+CONNECTION_PRAGMAS = """
+    PRAGMA auto_vacuum = INCREMENTAL;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA cache_size = -64000;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA busy_timeout = 5000;
+    PRAGMA foreign_keys = ON;
+"""
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=64)
+def _zoneinfo(name: str) -> ZoneInfo:
+    # The reminder tick resolves every group's timezone each minute.
+    return ZoneInfo(name)
+
+
+def _from_cents(rows: list[tuple[str, int]]) -> tuple[float, list[tuple[str, float]]]:
+    return sum(cents for _category, cents in rows) / 100, [(category, cents / 100) for category, cents in rows]
+
+
+def _local_date(moment: datetime, tz_name: str) -> str:
+    try:
+        return moment.astimezone(_zoneinfo(tz_name)).date().isoformat()
+    except Exception:
+        return ""
 
 
 class Database:
     def __init__(self, db_path: str) -> None:
         self.db_path = db_path
-
-    async def _add_column_if_missing(self, conn: aiosqlite.Connection, table: str, col_def: str) -> None:
-        col_name = col_def.split()[0]
+        self._expense_queue: asyncio.Queue[tuple[tuple, str, asyncio.Future[int]]] = asyncio.Queue()
+        self._expense_writer: asyncio.Task | None = None
+        self._feedback_buffer: list[tuple[int, str, str, str]] = []
+        self._feedback_flush: asyncio.Task | None = None
+        self._known_users: dict[int, tuple[str, str]] = {}
+        # Group settings only change through this process's commands, so they can be cached here.
+        self._group_titles: dict[int, str] = {}
+        self._context_cache: dict[int, dict] = {}
+        self._conn: aiosqlite.Connection | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def _connection(self) -> aiosqlite.Connection:
+        if self._conn is None:
+            raise RuntimeError("Database.init() must be awaited before use")
+        return self._conn
+
+    @asynccontextmanager
+    async def _write(self) -> AsyncIterator[aiosqlite.Connection]:
+        # One shared connection: serialize write transactions and never leave one half-open.
+        async with self._lock:
+            conn = self._connection
+            try:
+                yield conn
+            except BaseException:
+                await conn.rollback()
+                raise
+
+    async def _existing_columns(self, conn: aiosqlite.Connection, table: str) -> set[str]:
         cur = await conn.execute(f"PRAGMA table_info({table})")
-        rows = await cur.fetchall()
-        existing = {row[1] for row in rows}
-        if col_name not in existing:
-            await conn.execute(f"ALTER TABLE {table} ADD COLUMN {col_def}")
+        return {row[1] for row in await cur.fetchall()}
 
     async def init(self) -> None:
         path = Path(self.db_path)
         if path.parent:
             os.makedirs(path.parent, exist_ok=True)
 
-        async with aiosqlite.connect(self.db_path) as conn:
-            await conn.execute("PRAGMA foreign_keys = ON")
-            await conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT NOT NULL DEFAULT '',
-                    first_name TEXT NOT NULL DEFAULT '',
-                    created_at TEXT NOT NULL DEFAULT (datetime('now'))
-                )
-                """
-            )
-            await conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS group_settings (
-                    group_id INTEGER PRIMARY KEY,
-                    title TEXT NOT NULL DEFAULT '',
-                    currency TEXT NOT NULL DEFAULT 'RUB',
-                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-                    updated_at TEXT NOT NULL DEFAULT (datetime('now'))
-                )
-                """
-            )
-            await conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS expenses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    category TEXT NOT NULL,
-                    amount REAL NOT NULL,
-                    note TEXT NOT NULL DEFAULT '',
-                    spent_at TEXT NOT NULL,
-                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-                    source_message_id INTEGER NOT NULL,
-                    FOREIGN KEY(user_id) REFERENCES users(user_id)
+        try:
+            if self._conn is None:
+                self._conn = await aiosqlite.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
+                self._conn.row_factory = aiosqlite.Row
+                await self._conn.executescript(CONNECTION_PRAGMAS)
+            await self._migrate()
+        except BaseException:
+            # The connection's worker thread would otherwise keep a process whose startup failed alive.
+            if self._conn is not None:
+                await self._conn.close()
+                self._conn = None
+            raise
+
+    async def _migrate(self) -> None:
+        async with self._write() as conn:
+            # WAL is persistent: readers (web app) no longer block the bot's writes. journal_mode can't
+            # change inside a transaction; everything after BEGIN is committed once at the end of init().
+            # IMMEDIATE takes the write lock up front: the bot and the web app run init() on the same
+            # file at startup, and every check-then-migrate step below must see the other's result.
+            await conn.executescript(f"PRAGMA journal_mode = WAL; BEGIN IMMEDIATE; {SCHEMA_SQL}")
+            # Backward-compatible migrations for older table versions. Columns are read under the
+            # write lock taken above, so a concurrent init() can't add the same column in between.
+            columns: dict[str, set[str]] = {}
+            added_columns: set[tuple[str, str]] = set()
+            for table, col_defs in COLUMN_MIGRATIONS.items():
+                existing = columns[table] = await self._existing_columns(conn, table)
+                for col_def in col_defs:
+                    col_name = col_def.split()[0]
+                    if col_name not in existing:
+                        await conn.execute(f"ALTER TABLE {table} ADD COLUMN {col_def}")
+                        existing.add(col_name)
+                        added_columns.add((table, col_name))
+
+            if ("expenses", "spent_at_ts") in added_columns:
+                await conn.execute(
+                    "UPDATE expenses SET spent_at_ts = CAST(strftime('%s', spent_at) AS INTEGER) WHERE spent_at_ts IS NULL"
                 )
-                """
-            )
-            await conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS pending_expenses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    amount REAL NOT NULL,
-                    note TEXT NOT NULL DEFAULT '',
-                    source_message_id INTEGER NOT NULL,
-                    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+            if ("group_settings", "reminder_minutes") in added_columns:
+                # Unparseable legacy values get 1440, which no local time reaches (they were skipped before).
+                await conn.execute(
+                    """
+                    UPDATE group_settings
+                    SET reminder_minutes = CASE
+                      WHEN reminder_time GLOB '[0-2][0-9]:[0-5][0-9]'
+                        THEN CAST(substr(reminder_time, 1, 2) AS INTEGER) * 60 + CAST(substr(reminder_time, 4, 2) AS INTEGER)
+                      ELSE 1440
+                    END
+                    """
                 )
-                """
-            )
-
-            await self._add_column_if_missing(conn, "group_settings", "reminder_enabled INTEGER NOT NULL DEFAULT 1")
-            await self._add_column_if_missing(conn, "group_settings", "reminder_time TEXT NOT NULL DEFAULT '21:00'")
-            await self._add_column_if_missing(conn, "group_settings", "timezone TEXT NOT NULL DEFAULT 'Europe/Moscow'")
-            await self._add_column_if_missing(conn, "group_settings", "last_reminder_date TEXT NOT NULL DEFAULT ''")
-
-            await self._add_column_if_missing(conn, "expenses", "subcategory TEXT NOT NULL DEFAULT ''")
-            await self._add_column_if_missing(conn, "expenses", "auto_category TEXT NOT NULL DEFAULT ''")
-            await self._add_column_if_missing(conn, "expenses", "auto_subcategory TEXT NOT NULL DEFAULT ''")
-            await self._add_column_if_missing(conn, "expenses", "auto_confidence REAL NOT NULL DEFAULT 0")
-            await self._add_column_if_missing(conn, "expenses", "is_auto_applied INTEGER NOT NULL DEFAULT 0")
-            await self._add_column_if_missing(conn, "expenses", "raw_comment_normalized TEXT NOT NULL DEFAULT ''")
-
-            await self._add_column_if_missing(conn, "pending_expenses", "predicted_category TEXT NOT NULL DEFAULT ''")
-            await self._add_column_if_missing(conn, "pending_expenses", "predicted_subcategory TEXT NOT NULL DEFAULT ''")
-            await self._add_column_if_missing(conn, "pending_expenses", "predicted_confidence REAL NOT NULL DEFAULT 0")
-            await self._add_column_if_missing(conn, "pending_expenses", "raw_comment_normalized TEXT NOT NULL DEFAULT ''")
-
-            await conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS category_feedback (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER NOT NULL,
-                    raw_comment_normalized TEXT NOT NULL,
-                    predicted_subcategory TEXT NOT NULL,
-                    chosen_subcategory TEXT NOT NULL,
-                    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+            if ("group_settings", "last_expense_local_date") in added_columns:
+                cur = await conn.execute(
+                    """
+                    SELECT g.group_id, g.timezone, MAX(e.spent_at_ts)
+                    FROM group_settings g
+                    JOIN expenses e ON e.group_id = g.group_id
+                    GROUP BY g.group_id
+                    """
                 )
-                """
-            )
-            await conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS merchant_aliases (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER NOT NULL,
-                    normalized_pattern TEXT NOT NULL,
-                    subcategory TEXT NOT NULL,
-                    confidence REAL NOT NULL DEFAULT 0.9,
-                    source TEXT NOT NULL DEFAULT 'feedback',
-                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-                    UNIQUE(group_id, normalized_pattern)
+                await conn.executemany(
+                    "UPDATE group_settings SET last_expense_local_date = ? WHERE group_id = ?",
+                    [
+                        (_local_date(datetime.fromtimestamp(ts, timezone.utc), tz_name), group_id)
+                        for group_id, tz_name, ts in await cur.fetchall()
+                    ],
                 )
-                """
-            )
-            # Backward-compatible migrations for older table versions.
-            await self._add_column_if_missing(
-                conn,
-                "category_feedback",
-                "predicted_subcategory TEXT NOT NULL DEFAULT ''",
-            )
-            await self._add_column_if_missing(
-                conn,
-                "category_feedback",
-                "chosen_subcategory TEXT NOT NULL DEFAULT ''",
-            )
-            await self._add_column_if_missing(
-                conn,
-                "merchant_aliases",
-                "subcategory TEXT NOT NULL DEFAULT ''",
-            )
 
+            # Superseded by idx_expenses_summary_cover, which serves both summaries and reminder checks.
+            for index_name in ("idx_expenses_group_date", "idx_expenses_group_ts", "idx_expenses_group_category_date"):
+                await conn.execute(f"DROP INDEX IF EXISTS {index_name}")
             await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_expenses_group_date ON expenses(group_id, spent_at)"
+                "CREATE INDEX IF NOT EXISTS idx_expenses_summary_cover "
+                "ON expenses(group_id, spent_at_ts, category, amount)"
             )
             await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_expenses_group_category_date ON expenses(group_id, category, spent_at)"
+                "CREATE INDEX IF NOT EXISTS idx_expenses_group_user_id ON expenses(group_id, user_id, id DESC)"
             )
             await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_aliases_group_pattern ON merchant_aliases(group_id, normalized_pattern)"
+                "CREATE INDEX IF NOT EXISTS idx_feedback_group_norm ON category_feedback(group_id, raw_comment_normalized)"
             )
             # If table had legacy `category`, copy it into new `subcategory` only when empty.
-            cur = await conn.execute("PRAGMA table_info(merchant_aliases)")
-            cols = {row[1] for row in await cur.fetchall()}
-            if "category" in cols and "subcategory" in cols:
+            if "category" in columns["merchant_aliases"]:
                 await conn.execute(
                     """
                     UPDATE merchant_aliases
@@ -160,10 +320,95 @@ class Database:
                     WHERE subcategory = '' AND category <> ''
                     """
                 )
+            # Older tables carry a surrogate rowid id plus a UNIQUE index; rebuild them keyed
+            # by (group_id, normalized_pattern) directly. The id check above was read under the
+            # write lock, and the copy is INSERT OR IGNORE, so a re-run can't trip over itself.
+            if "id" in columns["merchant_aliases"]:
+                await conn.execute(f"CREATE TABLE IF NOT EXISTS merchant_aliases_v2 {MERCHANT_ALIASES_SCHEMA}")
+                await conn.execute(
+                    """
+                    INSERT OR IGNORE INTO merchant_aliases_v2
+                      (group_id, normalized_pattern, subcategory, confidence, source, created_at)
+                    SELECT group_id, normalized_pattern, subcategory, confidence, source,
+                           COALESCE(created_at, datetime('now'))
+                    FROM merchant_aliases
+                    """
+                )
+                await conn.execute("DROP TABLE merchant_aliases")
+                await conn.execute("ALTER TABLE merchant_aliases_v2 RENAME TO merchant_aliases")
             await conn.commit()
+            # Refresh planner statistics for tables that grew since the last run.
+            await conn.execute("PRAGMA optimize")
+
+    async def close(self) -> None:
+        # Safe after a failed or missing init(): there is nothing to flush or close then.
+        if self._conn is None:
+            return
+        if self._feedback_flush is not None:
+            await self._feedback_flush
+            self._feedback_flush = None
+        await self._flush_feedback()
+
+        if self._expense_writer is not None:
+            await self._expense_queue.join()
+            self._expense_writer.cancel()
+            try:
+                await self._expense_writer
+            except asyncio.CancelledError:
+                pass
+            self._expense_writer = None
+
+        await self._conn.execute("PRAGMA optimize")
+        await self._conn.close()
+        self._conn = None
+
+    async def run_maintenance(self) -> None:
+        async with self._write() as conn:
+            # Return pages freed by deletes (undo, confirmed pendings) to the filesystem in small steps.
+            # executescript steps the pragma to completion; execute() would free a single page.
+            await conn.executescript("PRAGMA incremental_vacuum(100); PRAGMA optimize;")
+
+    async def _run_expense_writer(self) -> None:
+        while True:
+            batch = [await self._expense_queue.get()]
+            while len(batch) < EXPENSE_BATCH_SIZE and not self._expense_queue.empty():
+                batch.append(self._expense_queue.get_nowait())
+            try:
+                await self._write_expenses(batch)
+            finally:
+                for _ in batch:
+                    self._expense_queue.task_done()
+
+    async def _write_expenses(self, batch: list[tuple[tuple, str, asyncio.Future[int]]]) -> None:
+        try:
+            expense_ids = []
+            async with self._write() as conn:
+                for params, _local_day, _future in batch:
+                    (row,) = await conn.execute_fetchall(INSERT_EXPENSE_SQL, params)
+                    expense_ids.append(int(row[0]))
+                await conn.executemany(
+                    UPDATE_LAST_EXPENSE_DATE_SQL,
+                    [(local_day, params[0]) for params, local_day, _future in batch if local_day],
+                )
+                await conn.executemany(
+                    BUMP_EXPENSES_VERSION_SQL,
+                    [(group_id,) for group_id in {params[0] for params, _local_day, _future in batch}],
+                )
+                await conn.commit()
+        except Exception as exc:
+            for _params, _local_day, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_params, _local_day, future), expense_id in zip(batch, expense_ids):
+            if not future.done():
+                future.set_result(expense_id)
 
     async def upsert_user(self, user_id: int, username: str, first_name: str) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        if self._known_users.get(user_id) == (username, first_name):
+            return
+        async with self._write() as conn:
             await conn.execute(
                 """
                 INSERT INTO users (user_id, username, first_name)
@@ -171,13 +416,17 @@ class Database:
                 ON CONFLICT(user_id) DO UPDATE SET
                   username=excluded.username,
                   first_name=excluded.first_name
+                WHERE users.username <> excluded.username OR users.first_name <> excluded.first_name
                 """,
                 (user_id, username, first_name),
             )
             await conn.commit()
+        self._known_users[user_id] = (username, first_name)
 
     async def ensure_group(self, group_id: int, title: str, default_currency: str, default_tz: str) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        if self._group_titles.get(group_id) == title:
+            return
+        async with self._write() as conn:
             await conn.execute(
                 """
                 INSERT INTO group_settings (group_id, title, currency, timezone)
@@ -185,10 +434,13 @@ class Database:
                 ON CONFLICT(group_id) DO UPDATE SET
                   title=excluded.title,
                   updated_at=datetime('now')
+                WHERE group_settings.title <> excluded.title
                 """,
                 (group_id, title, default_currency, default_tz),
             )
             await conn.commit()
+        self._group_titles[group_id] = title
+        self._context_cache.pop(group_id, None)
 
     async def setup_group(
         self,
@@ -197,7 +449,7 @@ class Database:
         currency: str,
         tz_name: str | None = None,
     ) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        async with self._write() as conn:
             if tz_name:
                 await conn.execute(
                     """
@@ -224,32 +476,41 @@ class Database:
                     (group_id, title, currency.upper()),
                 )
             await conn.commit()
+        self._group_titles[group_id] = title
+        self._context_cache.pop(group_id, None)
+
+    async def get_chat_context(self, group_id: int) -> dict | None:
+        cached = self._context_cache.get(group_id)
+        if cached is not None:
+            return cached
+        conn = self._connection
+        cur = await conn.execute(SELECT_CHAT_CONTEXT_SQL, (group_id,))
+        row = await cur.fetchone()
+        if row is None:
+            return None
+        context = dict(row)
+        self._context_cache[group_id] = context
+        return context
 
     async def get_group_currency(self, group_id: int, default_currency: str) -> str:
-        async with aiosqlite.connect(self.db_path) as conn:
-            cur = await conn.execute(
-                "SELECT currency FROM group_settings WHERE group_id = ?",
-                (group_id,),
-            )
-            row = await cur.fetchone()
-            return row[0] if row else default_currency
+        context = await self.get_chat_context(group_id)
+        return context["currency"] if context else default_currency
 
     async def get_group_settings(self, group_id: int) -> dict | None:
-        async with aiosqlite.connect(self.db_path) as conn:
-            conn.row_factory = aiosqlite.Row
-            cur = await conn.execute(
-                """
-                SELECT group_id, title, currency, timezone, reminder_enabled, reminder_time, last_reminder_date
-                FROM group_settings
-                WHERE group_id = ?
-                """,
-                (group_id,),
-            )
-            row = await cur.fetchone()
-            return dict(row) if row else None
+        conn = self._connection
+        cur = await conn.execute(
+            """
+            SELECT group_id, title, currency, timezone, reminder_enabled, reminder_time, last_reminder_date
+            FROM group_settings
+            WHERE group_id = ?
+            """,
+            (group_id,),
+        )
+        row = await cur.fetchone()
+        return dict(row) if row else None
 
     async def set_reminder_enabled(self, group_id: int, enabled: bool) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        async with self._write() as conn:
             await conn.execute(
                 """
                 UPDATE group_settings
@@ -259,21 +520,25 @@ class Database:
                 (1 if enabled else 0, group_id),
             )
             await conn.commit()
+        self._context_cache.pop(group_id, None)
 
     async def set_reminder_time(self, group_id: int, reminder_time: str) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        hours, minutes = reminder_time.split(":")
+        reminder_minutes = int(hours) * 60 + int(minutes)
+        async with self._write() as conn:
             await conn.execute(
                 """
                 UPDATE group_settings
-                SET reminder_time = ?, updated_at = datetime('now')
+                SET reminder_time = ?, reminder_minutes = ?, updated_at = datetime('now')
                 WHERE group_id = ?
                 """,
-                (reminder_time, group_id),
+                (reminder_time, reminder_minutes, group_id),
             )
             await conn.commit()
+        self._context_cache.pop(group_id, None)
 
     async def set_group_timezone(self, group_id: int, tz_name: str) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        async with self._write() as conn:
             await conn.execute(
                 """
                 UPDATE group_settings
@@ -283,9 +548,10 @@ class Database:
                 (tz_name, group_id),
             )
             await conn.commit()
+        self._context_cache.pop(group_id, None)
 
     async def mark_group_reminded(self, group_id: int, local_date: str) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        async with self._write() as conn:
             await conn.execute(
                 """
                 UPDATE group_settings
@@ -296,95 +562,51 @@ class Database:
             )
             await conn.commit()
 
-    async def _has_expenses_on_local_date(
-        self,
-        conn: aiosqlite.Connection,
-        group_id: int,
-        tz_name: str,
-        local_day: date,
-    ) -> bool:
-        tz = ZoneInfo(tz_name)
-        start_local = datetime.combine(local_day, time.min, tzinfo=tz)
-        end_local = start_local + timedelta(days=1)
-        start_utc = start_local.astimezone(timezone.utc).isoformat()
-        end_utc = end_local.astimezone(timezone.utc).isoformat()
-
-        cur = await conn.execute(
-            """
-            SELECT COUNT(*)
-            FROM expenses
-            WHERE group_id = ? AND spent_at >= ? AND spent_at < ?
-            """,
-            (group_id, start_utc, end_utc),
-        )
-        row = await cur.fetchone()
-        return int(row[0] or 0) > 0
-
     async def list_groups_due_for_reminder(self, now_utc: datetime) -> list[tuple[int, str, str]]:
         due: list[tuple[int, str, str]] = []
-        async with aiosqlite.connect(self.db_path) as conn:
-            conn.row_factory = aiosqlite.Row
-            cur = await conn.execute(
-                """
-                SELECT group_id, title, timezone, reminder_time, last_reminder_date
-                FROM group_settings
-                WHERE reminder_enabled = 1
-                """
-            )
-            rows = await cur.fetchall()
+        cur = await self._connection.execute(
+            """
+            SELECT group_id, title, timezone, reminder_minutes, last_reminder_date, last_expense_local_date
+            FROM group_settings
+            WHERE reminder_enabled = 1
+            """
+        )
+        rows = await cur.fetchall()
 
-            for row in rows:
-                group_id = int(row["group_id"])
-                title = row["title"] or ""
-                tz_name = row["timezone"] or "Europe/Moscow"
-                reminder_time = row["reminder_time"] or "21:00"
-                last_reminder_date = row["last_reminder_date"] or ""
+        for row in rows:
+            group_id = int(row["group_id"])
+            title = row["title"] or ""
+            tz_name = row["timezone"] or "Europe/Moscow"
+            last_reminder_date = row["last_reminder_date"] or ""
 
-                try:
-                    tz = ZoneInfo(tz_name)
-                    target_h, target_m = [int(x) for x in reminder_time.split(":", 1)]
-                except Exception:
-                    continue
-
-                local_now = now_utc.astimezone(tz)
-                local_date = local_now.date().isoformat()
+            try:
+                tz = _zoneinfo(tz_name)
+            except Exception:
+                continue
 
-                if last_reminder_date == local_date:
-                    continue
+            local_now = now_utc.astimezone(tz)
+            local_date = local_now.date().isoformat()
 
-                if (local_now.hour, local_now.minute) < (target_h, target_m):
-                    continue
+            if last_reminder_date == local_date:
+                continue
 
-                has_expenses = await self._has_expenses_on_local_date(conn, group_id, tz_name, local_now.date())
-                if has_expenses:
-                    # Mark to avoid repeated checks for the rest of day.
-                    await conn.execute(
-                        "UPDATE group_settings SET last_reminder_date = ?, updated_at = datetime('now') WHERE group_id = ?",
-                        (local_date, group_id),
-                    )
-                    continue
+            if local_now.hour * 60 + local_now.minute < row["reminder_minutes"]:
+                continue
 
-                due.append((group_id, title, local_date))
+            if row["last_expense_local_date"] == local_date:
+                continue
 
-            await conn.commit()
+            due.append((group_id, title, local_date))
 
         return due
 
     async def get_alias_subcategory(self, group_id: int, normalized_note: str) -> str | None:
         if not normalized_note:
             return None
-        async with aiosqlite.connect(self.db_path) as conn:
-            cur = await conn.execute(
-                """
-                SELECT subcategory
-                FROM merchant_aliases
-                WHERE group_id = ? AND normalized_pattern = ?
-                LIMIT 1
-                """,
-                (group_id, normalized_note),
-            )
-            row = await cur.fetchone()
-            return row[0] if row else None
+        conn = self._connection
+        cur = await conn.execute(SELECT_ALIAS_SQL, (group_id, normalized_note))
+        row = await cur.fetchone()
+        return row[0] if row else None
 
     async def create_pending_expense(
         self,
@@ -398,14 +620,15 @@ class Database:
         predicted_confidence: float = 0.0,
         raw_comment_normalized: str = "",
     ) -> int:
-        async with aiosqlite.connect(self.db_path) as conn:
-            cur = await conn.execute(
+        async with self._write() as conn:
+            (row,) = await conn.execute_fetchall(
                 """
                 INSERT INTO pending_expenses (
                     group_id, user_id, amount, note, source_message_id,
                     predicted_category, predicted_subcategory, predicted_confidence, raw_comment_normalized
                 )
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING id
                 """,
                 (
                     group_id,
@@ -420,52 +643,50 @@ class Database:
                 ),
             )
             await conn.commit()
-            return int(cur.lastrowid)
+            return int(row[0])
 
     async def get_pending(
         self, pending_id: int
     ) -> tuple[int, int, float, str, int, str, str, float, str] | None:
-        async with aiosqlite.connect(self.db_path) as conn:
-            cur = await conn.execute(
-                """
-                SELECT
-                  group_id, user_id, amount, note, source_message_id,
-                  predicted_category, predicted_subcategory, predicted_confidence, raw_comment_normalized
-                FROM pending_expenses
-                WHERE id = ?
-                """,
-                (pending_id,),
-            )
-            row = await cur.fetchone()
-            return tuple(row) if row else None
+        conn = self._connection
+        cur = await conn.execute(
+            """
+            SELECT
+              group_id, user_id, amount, note, source_message_id,
+              predicted_category, predicted_subcategory, predicted_confidence, raw_comment_normalized
+            FROM pending_expenses
+            WHERE id = ?
+            """,
+            (pending_id,),
+        )
+        row = await cur.fetchone()
+        return tuple(row) if row else None
 
     async def finalize_pending(self, pending_id: int, category: str, subcategory: str = "") -> int | None:
-        pending = await self.get_pending(pending_id)
-        if pending is None:
-            return None
-
-        (
-            group_id,
-            user_id,
-            amount,
-            note,
-            source_message_id,
-            predicted_category,
-            predicted_subcategory,
-            predicted_confidence,
-            raw_comment_normalized,
-        ) = pending
-        spent_at = datetime.now(timezone.utc).isoformat()
+        async with self._write() as conn:
+            # Read and finalize in one immediate transaction so a double-tapped
+            # button cannot turn the same pending row into two expenses.
+            await conn.execute("BEGIN IMMEDIATE")
+            pending = await self.get_pending(pending_id)
+            if pending is None:
+                await conn.rollback()
+                return None
 
-        async with aiosqlite.connect(self.db_path) as conn:
-            cur = await conn.execute(
-                """
-                INSERT INTO expenses (
-                    group_id, user_id, category, subcategory, amount, note, spent_at, source_message_id,
-                    auto_category, auto_subcategory, auto_confidence, is_auto_applied, raw_comment_normalized
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
+            (
+                group_id,
+                user_id,
+                amount,
+                note,
+                source_message_id,
+                predicted_category,
+                predicted_subcategory,
+                predicted_confidence,
+                raw_comment_normalized,
+            ) = pending
+            spent_at = datetime.now(timezone.utc)
+
+            (row,) = await conn.execute_fetchall(
+                INSERT_EXPENSE_SQL,
                 (
                     group_id,
                     user_id,
@@ -473,7 +694,8 @@ class Database:
                     subcategory,
                     amount,
                     note,
-                    spent_at,
+                    spent_at.isoformat(),
+                    int(spent_at.timestamp()),
                     source_message_id,
                     predicted_category,
                     predicted_subcategory,
@@ -482,9 +704,15 @@ class Database:
                     raw_comment_normalized,
                 ),
             )
+            expense_id = int(row[0])
             await conn.execute("DELETE FROM pending_expenses WHERE id = ?", (pending_id,))
+            context = await self.get_chat_context(group_id)
+            local_day = _local_date(spent_at, context["timezone"]) if context else ""
+            if local_day:
+                await conn.execute(UPDATE_LAST_EXPENSE_DATE_SQL, (local_day, group_id))
+            await conn.execute(BUMP_EXPENSES_VERSION_SQL, (group_id,))
             await conn.commit()
-            return int(cur.lastrowid)
+            return expense_id
 
     async def add_expense(
         self,
@@ -501,34 +729,30 @@ class Database:
         is_auto_applied: bool = False,
         raw_comment_normalized: str = "",
     ) -> int:
-        spent_at = datetime.now(timezone.utc).isoformat()
-        async with aiosqlite.connect(self.db_path) as conn:
-            cur = await conn.execute(
-                """
-                INSERT INTO expenses (
-                    group_id, user_id, category, subcategory, amount, note, spent_at, source_message_id,
-                    auto_category, auto_subcategory, auto_confidence, is_auto_applied, raw_comment_normalized
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    group_id,
-                    user_id,
-                    category,
-                    subcategory,
-                    amount,
-                    note,
-                    spent_at,
-                    source_message_id,
-                    auto_category,
-                    auto_subcategory,
-                    auto_confidence,
-                    1 if is_auto_applied else 0,
-                    raw_comment_normalized,
-                ),
-            )
-            await conn.commit()
-            return int(cur.lastrowid)
+        spent_at = datetime.now(timezone.utc)
+        params = (
+            group_id,
+            user_id,
+            category,
+            subcategory,
+            amount,
+            note,
+            spent_at.isoformat(),
+            int(spent_at.timestamp()),
+            source_message_id,
+            auto_category,
+            auto_subcategory,
+            auto_confidence,
+            1 if is_auto_applied else 0,
+            raw_comment_normalized,
+        )
+        context = await self.get_chat_context(group_id)
+        local_day = _local_date(spent_at, context["timezone"]) if context else ""
+        if self._expense_writer is None or self._expense_writer.done():
+            self._expense_writer = asyncio.create_task(self._run_expense_writer())
+        future: asyncio.Future[int] = asyncio.get_running_loop().create_future()
+        await self._expense_queue.put((params, local_day, future))
+        return await future
 
     async def record_feedback(
         self,
@@ -540,118 +764,150 @@ class Database:
         if not raw_comment_normalized:
             return
 
-        async with aiosqlite.connect(self.db_path) as conn:
-            await conn.execute(
+        self._feedback_buffer.append(
+            (group_id, raw_comment_normalized, predicted_subcategory, chosen_subcategory)
+        )
+        if self._feedback_flush is None or self._feedback_flush.done():
+            self._feedback_flush = asyncio.create_task(self._flush_feedback_soon())
+
+    async def _flush_feedback_soon(self) -> None:
+        await asyncio.sleep(FEEDBACK_FLUSH_DELAY_SEC)
+        try:
+            await self._flush_feedback()
+        except Exception:
+            logger.exception("failed to store category feedback")
+
+    async def _flush_feedback(self) -> None:
+        batch, self._feedback_buffer = self._feedback_buffer, []
+        if not batch:
+            return
+
+        async with self._write() as conn:
+            await conn.executemany(
                 """
                 INSERT INTO category_feedback (group_id, raw_comment_normalized, predicted_subcategory, chosen_subcategory)
                 VALUES (?, ?, ?, ?)
                 """,
-                (group_id, raw_comment_normalized, predicted_subcategory, chosen_subcategory),
+                batch,
             )
 
-            cur = await conn.execute(
+            # Re-evaluate alias promotion once per (group, note, choice) touched by this batch:
+            # the HAVING clause keeps the upsert a no-op until 3+ votes with >= 80% agreement.
+            await conn.executemany(
                 """
-                SELECT
-                  COUNT(*) AS total,
-                  SUM(CASE WHEN chosen_subcategory = ? THEN 1 ELSE 0 END) AS chosen_total
+                INSERT INTO merchant_aliases (group_id, normalized_pattern, subcategory, confidence, source)
+                SELECT group_id, raw_comment_normalized, ?, 0.97, 'feedback'
                 FROM category_feedback
                 WHERE group_id = ? AND raw_comment_normalized = ?
+                GROUP BY group_id, raw_comment_normalized
+                HAVING COUNT(*) >= 3 AND 5 * SUM(chosen_subcategory = ?) >= 4 * COUNT(*)
+                ON CONFLICT(group_id, normalized_pattern) DO UPDATE SET
+                  subcategory=excluded.subcategory,
+                  confidence=excluded.confidence,
+                  source='feedback'
                 """,
-                (chosen_subcategory, group_id, raw_comment_normalized),
+                [
+                    (chosen, group_id, raw, chosen)
+                    for group_id, raw, chosen in dict.fromkeys(
+                        (group_id, raw, chosen) for group_id, raw, _predicted, chosen in batch
+                    )
+                ],
             )
-            row = await cur.fetchone()
-            total = int(row[0] or 0)
-            chosen_total = int(row[1] or 0)
-
-            if total >= 3 and chosen_total / total >= 0.8:
-                await conn.execute(
-                    """
-                    INSERT INTO merchant_aliases (group_id, normalized_pattern, subcategory, confidence, source)
-                    VALUES (?, ?, ?, ?, 'feedback')
-                    ON CONFLICT(group_id, normalized_pattern) DO UPDATE SET
-                      subcategory=excluded.subcategory,
-                      confidence=excluded.confidence,
-                      source='feedback'
-                    """,
-                    (group_id, raw_comment_normalized, chosen_subcategory, 0.97),
-                )
 
             await conn.commit()
 
-    async def today_summary(self, group_id: int) -> tuple[float, list[tuple[str, float]]]:
-        start = datetime.now().strftime("%Y-%m-%d")
-        async with aiosqlite.connect(self.db_path) as conn:
-            cur = await conn.execute(
-                """
-                SELECT COALESCE(SUM(amount), 0)
-                FROM expenses
-                WHERE group_id = ? AND date(spent_at) = date(?)
-                """,
-                (group_id, start),
-            )
-            total_row = await cur.fetchone()
-
-            cur = await conn.execute(
-                """
-                SELECT category, COALESCE(SUM(amount), 0) AS total
-                FROM expenses
-                WHERE group_id = ? AND date(spent_at) = date(?)
-                GROUP BY category
-                ORDER BY total DESC
-                """,
-                (group_id, start),
-            )
-            rows = await cur.fetchall()
+    async def _category_summary(
+        self, group_id: int, start: datetime, end: datetime
+    ) -> tuple[float, list[tuple[str, float]]]:
+        # One grouped scan; the overall total is just the sum of the per-category rows.
+        cur = await self._connection.execute(
+            f"""
+            SELECT category, SUM({AMOUNT_CENTS_SQL}) AS total_cents
+            FROM expenses
+            WHERE group_id = ? AND spent_at_ts >= ? AND spent_at_ts < ?
+            GROUP BY category
+            ORDER BY total_cents DESC
+            """,
+            (group_id, int(start.timestamp()), int(end.timestamp())),
+        )
+        cur.row_factory = None
+        return _from_cents([(category, total_cents) async for category, total_cents in cur])
 
-        total = float(total_row[0] if total_row else 0)
-        return total, [(row[0], float(row[1])) for row in rows]
+    async def today_summary(self, group_id: int) -> tuple[float, list[tuple[str, float]]]:
+        now = datetime.now(timezone.utc)
+        start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+        return await self._category_summary(group_id, start, start + timedelta(days=1))
 
     async def month_summary(self, group_id: int) -> tuple[float, list[tuple[str, float]]]:
-        month = datetime.now().strftime("%Y-%m")
-        async with aiosqlite.connect(self.db_path) as conn:
-            cur = await conn.execute(
-                """
-                SELECT COALESCE(SUM(amount), 0)
-                FROM expenses
-                WHERE group_id = ? AND strftime('%Y-%m', spent_at) = ?
-                """,
-                (group_id, month),
-            )
-            total_row = await cur.fetchone()
-
-            cur = await conn.execute(
-                """
-                SELECT category, COALESCE(SUM(amount), 0) AS total
-                FROM expenses
-                WHERE group_id = ? AND strftime('%Y-%m', spent_at) = ?
-                GROUP BY category
-                ORDER BY total DESC
-                """,
-                (group_id, month),
-            )
-            rows = await cur.fetchall()
-
-        total = float(total_row[0] if total_row else 0)
-        return total, [(row[0], float(row[1])) for row in rows]
+        now = datetime.now(timezone.utc)
+        start = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+        end = datetime(now.year + now.month // 12, now.month % 12 + 1, 1, tzinfo=timezone.utc)
+        return await self._category_summary(group_id, start, end)
+
+    async def period_summary(
+        self, group_id: int
+    ) -> tuple[tuple[float, list[tuple[str, float]]], tuple[float, list[tuple[str, float]]]]:
+        # Today always lies inside the current month, so a single grouped scan of the
+        # month yields both breakdowns; the day totals come from a conditional SUM.
+        now = datetime.now(timezone.utc)
+        day_start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+        month_start = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+        month_end = datetime(now.year + now.month // 12, now.month % 12 + 1, 1, tzinfo=timezone.utc)
+        cur = await self._connection.execute(
+            f"""
+            SELECT
+                category,
+                SUM({AMOUNT_CENTS_SQL}),
+                SUM(CASE WHEN spent_at_ts >= ? AND spent_at_ts < ? THEN {AMOUNT_CENTS_SQL} END)
+            FROM expenses
+            WHERE group_id = ? AND spent_at_ts >= ? AND spent_at_ts < ?
+            GROUP BY category
+            """,
+            (
+                int(day_start.timestamp()),
+                int((day_start + timedelta(days=1)).timestamp()),
+                group_id,
+                int(month_start.timestamp()),
+                int(month_end.timestamp()),
+            ),
+        )
+        cur.row_factory = None
+        today_rows: list[tuple[str, int]] = []
+        month_rows: list[tuple[str, int]] = []
+        async for category, month_cents, day_cents in cur:
+            month_rows.append((category, month_cents))
+            if day_cents is not None:
+                today_rows.append((category, day_cents))
+        today_rows.sort(key=itemgetter(1), reverse=True)
+        month_rows.sort(key=itemgetter(1), reverse=True)
+        return _from_cents(today_rows), _from_cents(month_rows)
+
+    async def expenses_version(self, group_id: int) -> int:
+        cur = await self._connection.execute(
+            "SELECT expenses_version FROM group_settings WHERE group_id = ?",
+            (group_id,),
+        )
+        row = await cur.fetchone()
+        return int(row[0]) if row else 0
 
     async def last_expenses(self, group_id: int, limit: int = 10) -> list[tuple[int, float, str, str, str, int]]:
-        async with aiosqlite.connect(self.db_path) as conn:
-            cur = await conn.execute(
-                """
-                SELECT id, amount, category, subcategory, note, user_id
-                FROM expenses
-                WHERE group_id = ?
-                ORDER BY id DESC
-                LIMIT ?
-                """,
-                (group_id, limit),
-            )
-            rows = await cur.fetchall()
-
-        return [(int(row[0]), float(row[1]), row[2], row[3], row[4], int(row[5])) for row in rows]
+        conn = self._connection
+        cur = await conn.execute(
+            """
+            SELECT id, amount, category, subcategory, note, user_id
+            FROM expenses
+            WHERE group_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            (group_id, limit),
+        )
+        # Plain tuples, converted as they are streamed off the cursor.
+        cur.row_factory = None
+        return [(int(row[0]), float(row[1]), row[2], row[3], row[4], int(row[5])) async for row in cur]
 
     async def undo_last_by_user(self, group_id: int, user_id: int) -> int | None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        async with self._write() as conn:
             cur = await conn.execute(
                 """
                 SELECT id
@@ -668,18 +924,34 @@ class Database:
 
             expense_id = int(row[0])
             await conn.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
+            await conn.execute(BUMP_EXPENSES_VERSION_SQL, (group_id,))
+
+            # Undoing the group's only expense of the local day must re-arm today's reminder.
+            context = await self.get_chat_context(group_id)
+            if context:
+                try:
+                    tz = _zoneinfo(context["timezone"])
+                except Exception:
+                    tz = None
+                if tz is not None:
+                    day_start = datetime.combine(datetime.now(tz).date(), time.min, tzinfo=tz)
+                    await conn.execute(
+                        """
+                        UPDATE group_settings
+                        SET last_expense_local_date = ''
+                        WHERE group_id = ? AND NOT EXISTS (
+                            SELECT 1 FROM expenses WHERE group_id = ? AND spent_at_ts >= ?
+                        )
+                        """,
+                        (group_id, group_id, int(day_start.timestamp())),
+                    )
             await conn.commit()
             return expense_id
 
 
 def format_category_lines(rows: list[tuple[str, float]]) -> str:
-    if not rows:
-        return "Нет расходов"
-
-    lines = []
-    for category, total in rows:
-        lines.append(f"- {category_label(category)}: {total:.2f}")
-    return "\n".join(lines)
+    label = CATEGORY_LABEL.get
+    return "\n".join(f"- {label(category, category)}: {total:.2f}" for category, total in rows) or "Нет расходов"
 
 
 def format_last_line(
@@ -692,5 +964,8 @@ def format_last_line(
     currency: str,
 ) -> str:
     note_part = f" | {note}" if note else ""
-    sub = f"/{subcategory_label(subcategory)}" if subcategory else ""
-    return f"#{expense_id} {amount:.2f} {currency} | {category_label(category)}{sub} | user:{user_id}{note_part}"
+    sub = f"/{SUBCATEGORY_LABEL.get(subcategory, subcategory)}" if subcategory else ""
+    return (
+        f"#{expense_id} {amount:.2f} {currency} | {CATEGORY_LABEL.get(category, category)}{sub}"
+        f" | user:{user_id}{note_part}"
+    )
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+from collections.abc import Mapping
 from dataclasses import dataclass
+from types import MappingProxyType
 
 # Top-level categories stay unchanged for current MVP reports.
-CATEGORY_LABEL: dict[str, str] = {
+# Label tables are read-only: web_api precomputes dashboard entries from them at import time.
+CATEGORY_LABEL: Mapping[str, str] = MappingProxyType({
     "food": "Еда",
     "transport": "Транспорт",
     "home": "Дом",
@@ -12,10 +15,10 @@ CATEGORY_LABEL: dict[str, str] = {
     "shopping": "Покупки",
     "subscriptions": "Подписки",
     "other": "Другое",
-}
+})
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class SubcategoryDef:
     key: str
     label: str
@@ -132,8 +135,10 @@ SUBCATEGORIES: tuple[SubcategoryDef, ...] = (
     ),
 )
 
-SUBCATEGORY_LABEL: dict[str, str] = {x.key: x.label for x in SUBCATEGORIES}
+SUBCATEGORY_LABEL: Mapping[str, str] = MappingProxyType({x.key: x.label for x in SUBCATEGORIES})
 SUBCATEGORY_TO_CATEGORY: dict[str, str] = {x.key: x.category for x in SUBCATEGORIES}
+KEYWORD_TO_SUBCAT: dict[str, str] = {kw: x.key for x in SUBCATEGORIES for kw in x.keywords}
+KEYWORD_TO_CATEGORY: dict[str, str] = {kw: x.category for x in SUBCATEGORIES for kw in x.keywords}
 
 
 def category_label(key: str) -> str:
@@ -142,3 +147,10 @@ def category_label(key: str) -> str:
 
 def subcategory_label(key: str) -> str:
     return SUBCATEGORY_LABEL.get(key, key)
+
+
+def classify_token(token: str) -> tuple[str, str] | None:
+    subcategory = KEYWORD_TO_SUBCAT.get(token)
+    if subcategory is None:
+        return None
+    return subcategory, KEYWORD_TO_CATEGORY[token]
@@ -1,27 +1,98 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import time
+import zlib
+from datetime import datetime, timezone
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import FileResponse
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 
 from .config import load_settings
 from .db import Database
-from .taxonomy import category_label, subcategory_label
+from .taxonomy import CATEGORY_LABEL, SUBCATEGORY_LABEL
 
-app = FastAPI(title="FinTracker WebApp", version="1.0.0")
+app = FastAPI(title="FinTracker WebApp", version="1.0.0", default_response_class=ORJSONResponse)
 settings = load_settings()
 db = Database(settings.db_path)
 
+# The page ships inside the image, so it is read and fingerprinted once.
+_INDEX_PATH = Path(__file__).parent / "static" / "fintracker.html"
+_INDEX_BYTES = _INDEX_PATH.read_bytes()
+_INDEX_ETAG = f'"{hashlib.md5(_INDEX_BYTES).hexdigest()}"'
+_INDEX_HEADERS = {"ETag": _INDEX_ETAG, "Cache-Control": "public, max-age=300"}
+
+# Static key/label part of each dashboard category entry; requests only add the amount.
+_CAT_TPL: dict[str, dict[str, str]] = {k: {"key": k, "label": v} for k, v in CATEGORY_LABEL.items()}
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return if_none_match == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+def _category_items(rows: list[tuple[str, float]]) -> list[dict]:
+    return [{**(_CAT_TPL.get(k) or {"key": k, "label": k}), "amount": v} for k, v in rows]
+
+
+def _group_json_prefix(group_id: int, group: dict) -> bytes:
+    block = {
+        "id": group_id,
+        "title": group.get("title") or "FinTracker",
+        "currency": group.get("currency") or settings.default_currency,
+        "timezone": group.get("timezone") or settings.default_timezone,
+    }
+    return b'{"group":' + orjson.dumps(block) + b","
+
+
+# Settings are changed by the bot process, which can't reach this cache, so entries simply expire.
+# Entries hold the already-encoded opening of the dashboard payload.
+GROUP_CACHE_TTL_SEC = 30.0
+GROUP_CACHE_MAX_SIZE = 1024
+_group_cache: dict[int, tuple[float, bytes]] = {}
+
+
+async def _cached_group_prefix(group_id: int) -> bytes | None:
+    now = time.monotonic()
+    cached = _group_cache.get(group_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    group = await db.get_group_settings(group_id)
+    # Drop this group's expired entry first so a refresh never evicts some other live group.
+    _group_cache.pop(group_id, None)
+    if group is None:
+        return None
+    prefix = _group_json_prefix(group_id, group)
+    if len(_group_cache) >= GROUP_CACHE_MAX_SIZE:
+        _group_cache.pop(next(iter(_group_cache)))
+    _group_cache[group_id] = (now + GROUP_CACHE_TTL_SEC, prefix)
+    return prefix
+
 
 @app.on_event("startup")
 async def startup() -> None:
-    await db.init()
+    # The shutdown hook doesn't run when startup fails, so release the connection here.
+    try:
+        await db.init()
+    except BaseException:
+        await db.close()
+        raise
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await db.close()
 
 
 @app.get("/")
-async def index() -> FileResponse:
-    return FileResponse(Path(__file__).parent / "static" / "fintracker.html")
+async def index(request: Request) -> Response:
+    if _etag_matches(request, _INDEX_ETAG):
+        return Response(status_code=304, headers=_INDEX_HEADERS)
+    return Response(content=_INDEX_BYTES, media_type="text/html", headers=_INDEX_HEADERS)
 
 
 @app.get("/health")
@@ -30,50 +101,57 @@ async def health() -> dict:
 
 
 @app.get("/api/dashboard")
-async def api_dashboard(group_id: int = Query(...)) -> dict:
-    group = await db.get_group_settings(group_id)
-    if group is None:
+async def api_dashboard(request: Request, group_id: int = Query(...)) -> Response:
+    # Taken before the summaries run, so a poll across midnight can't pin yesterday's body.
+    today = datetime.now(timezone.utc).date()
+    group_prefix, expenses_version = await asyncio.gather(
+        _cached_group_prefix(group_id),
+        db.expenses_version(group_id),
+    )
+    if group_prefix is None:
         raise HTTPException(status_code=404, detail="Group not found")
 
-    currency = group.get("currency") or settings.default_currency
-    today_total, today_rows = await db.today_summary(group_id)
-    month_total, month_rows = await db.month_summary(group_id)
-    last_rows = await db.last_expenses(group_id, limit=20)
-
-    today_categories = [
-        {"key": k, "label": category_label(k), "amount": v} for k, v in today_rows
-    ]
-    month_categories = [
-        {"key": k, "label": category_label(k), "amount": v} for k, v in month_rows
+    # Polls answer 304 until an expense is added or removed, the day rolls over or settings change.
+    etag = f'"{expenses_version}-{today:%Y%m%d}-{zlib.crc32(group_prefix):08x}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    # Queue the remaining reads at once; the connection's worker thread runs them back to back.
+    ((today_total, today_rows), (month_total, month_rows)), last_rows = await asyncio.gather(
+        db.period_summary(group_id),
+        db.last_expenses(group_id, limit=20),
+    )
+
+    today_categories = _category_items(today_rows)
+    month_categories = _category_items(month_rows)
+
+    category_label = CATEGORY_LABEL.get
+    subcategory_label = SUBCATEGORY_LABEL.get
+    transactions = [
+        {
+            "id": expense_id,
+            "amount": amount,
+            "category": category,
+            "category_label": category_label(category, category),
+            "subcategory": subcategory,
+            "subcategory_label": subcategory_label(subcategory, subcategory) if subcategory else "",
+            "note": note,
+            "user_id": user_id,
+        }
+        for expense_id, amount, category, subcategory, note, user_id in last_rows
     ]
 
-    transactions = []
-    for expense_id, amount, category, subcategory, note, user_id in last_rows:
-        transactions.append(
-            {
-                "id": expense_id,
-                "amount": amount,
-                "category": category,
-                "category_label": category_label(category),
-                "subcategory": subcategory,
-                "subcategory_label": subcategory_label(subcategory) if subcategory else "",
-                "note": note,
-                "user_id": user_id,
-            }
-        )
-
-    return {
-        "group": {
-            "id": group_id,
-            "title": group.get("title") or "FinTracker",
-            "currency": currency,
-            "timezone": group.get("timezone") or settings.default_timezone,
-        },
-        "totals": {
-            "today": today_total,
-            "month": month_total,
-        },
-        "today_categories": today_categories,
-        "month_categories": month_categories,
-        "transactions": transactions,
-    }
+    payload = orjson.dumps(
+        {
+            "totals": {
+                "today": today_total,
+                "month": month_total,
+            },
+            "today_categories": today_categories,
+            "month_categories": month_categories,
+            "transactions": transactions,
+        }
+    )
+    # The cached prefix already opens the object, so drop the payload's own "{".
+    return Response(content=group_prefix + payload[1:], media_type="application/json", headers=headers)
@@ -4,4 +4,5 @@ import uvicorn
 
 
 if __name__ == "__main__":
-    uvicorn.run("app.web_api:app", host="0.0.0.0", port=8089, reload=False)
+    # uvloop and httptools are the C event loop and HTTP parser; uvicorn's defaults are asyncio and h11.
+    uvicorn.run("app.web_api:app", host="0.0.0.0", port=8089, reload=False, loop="uvloop", http="httptools")